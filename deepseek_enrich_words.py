@@ -1,12 +1,29 @@
 ﻿import argparse
+import asyncio
 import csv
+import heapq
 import json
 import os
 import shutil
 import sys
-import time
-import urllib.request
-import urllib.error
+
+import aiohttp
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib json module works too, just slower
+    orjson = None
+
+def json_dumps_bytes(obj):
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+def json_loads(raw):
+    # orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch either.
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 def normalize_item(item):
     if isinstance(item, str):
@@ -23,22 +40,26 @@ def normalize_item(item):
         return json.dumps(item, ensure_ascii=False)
     return str(item).strip()
 
+def estimate_tokens(text):
+    # Rough count for Arabic script: ~2 UTF-8 bytes per token, plus the "N. " prefix.
+    return len(text.encode("utf-8")) // 2 + 3
+
 def extract_json_array(text):
     text = text.strip()
     try:
-        return json.loads(text)
+        return json_loads(text)
     except json.JSONDecodeError:
         start = text.find("[")
         end = text.rfind("]")
         if start != -1 and end != -1 and end > start:
             snippet = text[start:end + 1]
             try:
-                return json.loads(snippet)
+                return json_loads(snippet)
             except json.JSONDecodeError:
                 return None
     return None
 
-def call_deepseek(words, model, api_key, base_url, timeout, senses):
+async def acall_deepseek(session, words, model, api_key, base_url, timeout, senses):
     system_text = (
         "你是阿拉伯语词典助手。"
         "请按顺序为每个词提供简洁的中文‘词义和词性’。"
@@ -58,26 +79,25 @@ def call_deepseek(words, model, api_key, base_url, timeout, senses):
         ],
         "temperature": 0.2,
         "top_p": 1,
-        "max_tokens": 800,
+        "max_tokens": min(8192, max(256, len(words) * 25 * senses)),
         "stream": False,
     }
 
     url = base_url.rstrip("/") + "/chat/completions"
-    req = urllib.request.Request(
+    async with session.post(
         url,
-        data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+        data=json_dumps_bytes(body),
         headers={
             "Authorization": f"Bearer {api_key}",
             "Content-Type": "application/json",
         },
-        method="POST",
-    )
-
-    with urllib.request.urlopen(req, timeout=timeout) as resp:
-        raw = resp.read().decode("utf-8", errors="ignore")
+        timeout=aiohttp.ClientTimeout(total=timeout),
+    ) as resp:
+        raw = await resp.read()
+        if resp.status >= 400:
+            raise RuntimeError(f"HTTP {resp.status}: {raw[:200].decode('utf-8', errors='ignore')}")
 
-    raw = raw.lstrip()
-    data = json.loads(raw)
+    data = json_loads(raw.lstrip())
 
     if "error" in data:
         raise RuntimeError(f"API error: {data['error']}")
@@ -88,11 +108,11 @@ def call_deepseek(words, model, api_key, base_url, timeout, senses):
         raise ValueError("Model output is not a JSON array")
     return arr
 
-def call_with_retries(words, model, api_key, base_url, timeout, retries, backoff, senses):
+async def acall_with_retries(session, words, model, api_key, base_url, timeout, retries, backoff, senses):
     last_err = None
     for attempt in range(retries):
         try:
-            result = call_deepseek(words, model, api_key, base_url, timeout, senses)
+            result = await acall_deepseek(session, words, model, api_key, base_url, timeout, senses)
             if len(result) != len(words):
                 raise ValueError("Output length mismatch")
             return result
@@ -100,9 +120,121 @@ def call_with_retries(words, model, api_key, base_url, timeout, retries, backoff
             last_err = exc
             wait = backoff * (2 ** attempt)
             print(f"[retry {attempt + 1}/{retries}] {exc}. sleep {wait:.1f}s", file=sys.stderr)
-            time.sleep(wait)
+            await asyncio.sleep(wait)
     raise last_err
 
+def make_session(pool_size):
+    # One pooled session per run: TCP + TLS to the API host are set up once and
+    # reused by every batch (keep-alive outlives --sleep and retry backoff).
+    connector = aiohttp.TCPConnector(
+        limit=pool_size,
+        limit_per_host=pool_size,
+        keepalive_timeout=120,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+async def translate_once(words, model, api_key, base_url, timeout, retries, backoff, senses):
+    async with make_session(1) as session:
+        return await acall_with_retries(
+            session, words, model, api_key, base_url, timeout, retries, backoff, senses
+        )
+
+async def enrich_batches(rows, word_idx, fout, writer, remaining, args, api_key):
+    work_q = asyncio.Queue(maxsize=args.max_concurrency * 2)
+    result_q = asyncio.Queue()
+    written = 0
+
+    async def produce():
+        batch_index = 0
+        batch_rows = []
+        batch_words = []
+        batch_tokens = 0
+        taken = 0
+        for row in rows:
+            if remaining is not None and taken >= remaining:
+                break
+            word = row[word_idx].strip()
+            cost = estimate_tokens(word)
+            # Close the batch early if this word would push the prompt past the budget.
+            if batch_words and batch_tokens + cost > args.max_prompt_tokens:
+                await work_q.put((batch_index, batch_rows, batch_words))
+                batch_index += 1
+                batch_rows = []
+                batch_words = []
+                batch_tokens = 0
+            batch_rows.append(row)
+            batch_words.append(word)
+            batch_tokens += cost
+            taken += 1
+            if len(batch_words) == args.batch:
+                await work_q.put((batch_index, batch_rows, batch_words))
+                batch_index += 1
+                batch_rows = []
+                batch_words = []
+                batch_tokens = 0
+        if batch_words:
+            await work_q.put((batch_index, batch_rows, batch_words))
+        for _ in range(args.max_concurrency):
+            await work_q.put(None)
+
+    async def work(session):
+        while True:
+            item = await work_q.get()
+            if item is None:
+                return
+            batch_index, batch_rows, words = item
+            results = await acall_with_retries(
+                session,
+                words,
+                args.model,
+                api_key,
+                args.base_url,
+                args.timeout,
+                args.retries,
+                args.backoff,
+                args.senses,
+            )
+            await result_q.put((batch_index, batch_rows, results))
+            if args.sleep > 0:
+                await asyncio.sleep(args.sleep)
+
+    async def write():
+        nonlocal written
+        pending = []
+        next_index = 0
+        unsynced = 0
+        while True:
+            item = await result_q.get()
+            if item is None:
+                return
+            # Write batches in input order so an interrupted run stays resumable.
+            heapq.heappush(pending, item)
+            while pending and pending[0][0] == next_index:
+                _, done_rows, results = heapq.heappop(pending)
+                writer.writerows(r + [normalize_item(meaning)] for r, meaning in zip(done_rows, results))
+                written += len(done_rows)
+                next_index += 1
+                unsynced += 1
+                if unsynced >= args.flush_every:
+                    fout.flush()
+                    os.fsync(fout.fileno())
+                    unsynced = 0
+
+    async with make_session(args.max_concurrency) as session:
+        writer_task = asyncio.create_task(write())
+        tasks = [asyncio.create_task(produce())]
+        tasks += [asyncio.create_task(work(session)) for _ in range(args.max_concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await result_q.put(None)
+            await writer_task
+    return written
+
 def count_existing_rows(path, expected_header):
     if not os.path.exists(path):
         return 0
@@ -130,7 +262,7 @@ def rewrite_first_rows(input_path, output_path, count, model, api_key, base_url,
     if len(words) < count:
         raise SystemExit("Input has fewer rows than --rewrite-first")
 
-    results = call_with_retries(
+    results = asyncio.run(translate_once(
         words,
         model,
         api_key,
@@ -139,34 +271,35 @@ def rewrite_first_rows(input_path, output_path, count, model, api_key, base_url,
         retries,
         backoff,
         senses,
-    )
+    ))
     if len(results) != count:
         raise SystemExit("Output length mismatch")
 
     results = [normalize_item(x) for x in results]
 
+    tmp_path = output_path + ".tmp"
+    rows_seen = 0
     with open(output_path, "r", encoding="utf-8-sig", newline="") as fout:
         out_reader = csv.DictReader(fout)
         headers = out_reader.fieldnames or []
         if "meaning_pos" not in headers:
             raise SystemExit("Output missing meaning_pos column")
-        rows = list(out_reader)
+        with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=headers)
+            writer.writeheader()
+            for i, row in enumerate(out_reader):
+                if i < count:
+                    row["meaning_pos"] = results[i]
+                writer.writerow(row)
+                rows_seen += 1
 
-    if len(rows) < count:
+    if rows_seen < count:
+        os.remove(tmp_path)
         raise SystemExit("Output has fewer rows than --rewrite-first")
 
-    for i in range(count):
-        rows[i]["meaning_pos"] = results[i]
-
     backup = output_path + ".bak_rewrite"
     shutil.copy2(output_path, backup)
 
-    tmp_path = output_path + ".tmp"
-    with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
-        writer = csv.DictWriter(f, fieldnames=headers)
-        writer.writeheader()
-        writer.writerows(rows)
-
     os.replace(tmp_path, output_path)
     print(f"Rewrote first {count} rows. Backup: {backup}")
 
@@ -174,7 +307,8 @@ def main():
     p = argparse.ArgumentParser()
     p.add_argument("--input", default="common_words_wid.csv")
     p.add_argument("--output", default="common_words_wid_enriched.csv")
-    p.add_argument("--batch", type=int, default=10)
+    p.add_argument("--batch", type=int, default=30, help="max words per request")
+    p.add_argument("--max-prompt-tokens", type=int, default=2000, help="estimated token budget for the word list")
     p.add_argument("--limit", type=int, default=0, help="0 means no limit")
     p.add_argument("--start", type=int, default=1, help="1-based row index in input (excluding header)")
     p.add_argument("--senses", type=int, default=1, help="max common senses per word")
@@ -185,6 +319,8 @@ def main():
     p.add_argument("--retries", type=int, default=3)
     p.add_argument("--backoff", type=float, default=2.0)
     p.add_argument("--sleep", type=float, default=0.0, help="sleep between batches")
+    p.add_argument("--max-concurrency", type=int, default=4, help="batches in flight at once")
+    p.add_argument("--flush-every", type=int, default=4, help="flush and fsync output every N batches")
     p.add_argument("--overwrite", action="store_true")
     resume_group = p.add_mutually_exclusive_group()
     resume_group.add_argument("--resume", action="store_true", help="resume from existing output if present")
@@ -211,13 +347,18 @@ def main():
         return
 
     with open(args.input, "r", encoding="utf-8-sig", newline="") as fin:
-        reader = csv.DictReader(fin)
-        if not reader.fieldnames:
+        reader = csv.reader(fin)
+        header = next(reader, None)
+        if not header:
             raise SystemExit("Input CSV has no header")
-        if "word" not in reader.fieldnames:
+        if "word" not in header:
             raise SystemExit("Input CSV must contain a 'word' column")
+        word_idx = header.index("word")
+        width = len(header)
+        # Plain lists instead of dicts: skip blank lines and pad/trim each row to the header.
+        rows = ((r + [""] * (width - len(r)))[:width] for r in reader if r)
 
-        out_fields = list(reader.fieldnames) + ["meaning_pos"]
+        out_fields = header + ["meaning_pos"]
 
         resume_allowed = not args.no_resume
         if args.resume:
@@ -226,79 +367,38 @@ def main():
         processed = 0
         if os.path.exists(args.output) and not args.overwrite and resume_allowed:
             processed = count_existing_rows(args.output, out_fields)
-            fout = open(args.output, "a", encoding="utf-8-sig", newline="")
-            writer = csv.DictWriter(fout, fieldnames=out_fields)
+            fout = open(args.output, "a", encoding="utf-8-sig", newline="", buffering=1 << 20)
+            writer = csv.writer(fout)
         else:
             if os.path.exists(args.output) and not args.overwrite and not resume_allowed:
                 raise SystemExit("Output exists. Use --overwrite or --resume.")
-            fout = open(args.output, "w", encoding="utf-8-sig", newline="")
-            writer = csv.DictWriter(fout, fieldnames=out_fields)
-            writer.writeheader()
+            fout = open(args.output, "w", encoding="utf-8-sig", newline="", buffering=1 << 20)
+            writer = csv.writer(fout)
+            writer.writerow(out_fields)
 
         try:
             if args.start < 1:
                 raise SystemExit("--start must be >= 1")
+            if args.max_concurrency < 1:
+                raise SystemExit("--max-concurrency must be >= 1")
             skip_target = max(processed, args.start - 1)
             skipped = 0
             for _ in range(skip_target):
-                if next(reader, None) is None:
+                if next(rows, None) is None:
                     break
                 skipped += 1
             if skipped < skip_target:
                 raise SystemExit("Skip target exceeds input rows; aborting.")
 
-            total_written = processed
-            batch_rows = []
-            batch_words = []
-
-            for row in reader:
-                if args.limit and total_written >= args.limit:
-                    break
-
-                word = row.get("word", "").strip()
-                batch_rows.append(row)
-                batch_words.append(word)
-
-                if len(batch_words) == args.batch:
-                    results = call_with_retries(
-                        batch_words,
-                        args.model,
-                        api_key,
-                        args.base_url,
-                        args.timeout,
-                        args.retries,
-                        args.backoff,
-                        args.senses,
-                    )
-                    for r, meaning in zip(batch_rows, results):
-                        r = dict(r)
-                        r["meaning_pos"] = normalize_item(meaning)
-                        writer.writerow(r)
-                        total_written += 1
-                    batch_rows = []
-                    batch_words = []
-                    if args.sleep > 0:
-                        time.sleep(args.sleep)
-
-            if batch_words and (not args.limit or total_written < args.limit):
-                results = call_with_retries(
-                    batch_words,
-                    args.model,
-                    api_key,
-                    args.base_url,
-                    args.timeout,
-                    args.retries,
-                    args.backoff,
-                    args.senses,
-                )
-                for r, meaning in zip(batch_rows, results):
-                    r = dict(r)
-                    r["meaning_pos"] = normalize_item(meaning)
-                    writer.writerow(r)
-                    total_written += 1
-
+            remaining = None
+            if args.limit:
+                remaining = max(args.limit - processed, 0)
+            written = asyncio.run(enrich_batches(rows, word_idx, fout, writer, remaining, args, api_key))
+            total_written = processed + written
             print(f"Done. Wrote {total_written} rows to {args.output}")
         finally:
+            fout.flush()
+            os.fsync(fout.fileno())
             fout.close()
 
 if __name__ == "__main__":
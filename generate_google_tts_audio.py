@@ -1,60 +1,206 @@
+import asyncio
 import csv
-import requests
-import time
 import os
+import random
+import shutil
+from collections import defaultdict
+from pathlib import Path
 
-# 从CSV读取单词并生成音频
-def generate_audio_files(csv_file, start_id=None):
-    # 创建audios文件夹（如果不存在）
-    if not os.path.exists('audios'):
-        os.makedirs('audios')
-    
+import aiohttp
+from aiolimiter import AsyncLimiter
+
+TTS_HOST = "http://translate.google.com"
+TTS_URL = TTS_HOST + "/translate_tts"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# 请求失败时指数退避重试（带随机抖动），429 时优先遵循 Retry-After
+# 每次真正发请求前才取令牌，退避等待期间不占用令牌
+async def _get_with_retries(session, limiter, url, params, retries=5, base=0.5):
+    last_err = None
+    for attempt in range(retries):
+        wait = base * (2 ** attempt) + random.uniform(0, 0.25)
+        try:
+            await limiter.acquire()
+            async with session.get(url, params=params) as response:
+                if response.status == 200:
+                    return await response.read()
+                last_err = f"http_{response.status}"
+                if response.status not in RETRY_STATUSES:
+                    break
+                retry_after = response.headers.get("Retry-After")
+                if response.status == 429 and retry_after:
+                    try:
+                        wait = max(wait, float(retry_after))
+                    except ValueError:
+                        pass
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            last_err = f"client_error:{exc}"
+        if attempt + 1 < retries:
+            await asyncio.sleep(wait)
+    raise RuntimeError(last_err)
+
+# 启动时先发一个 HEAD 请求，提前完成 DNS 解析和建连，连接留在池里复用
+async def _prewarm(session):
+    try:
+        async with session.head(TTS_HOST + "/"):
+            pass
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        pass
+
+# 先写 .part 再改名，中途崩溃不会留下会被当成“已存在”的半截文件
+def _write_atomic(path, data):
+    tmp = path + ".part"
+    Path(tmp).write_bytes(data)
+    os.replace(tmp, path)
+
+# 下载单个单词的音频，失败时返回原因
+async def _fetch(session, semaphore, limiter, word_id, word, audio_path):
+    params = {"ie": "UTF-8", "q": word, "tl": "ar", "client": "tw-ob"}
+    async with semaphore:
+        try:
+            data = await _get_with_retries(session, limiter, TTS_URL, params)
+        except RuntimeError as exc:
+            print(f"生成失败 - ID: {word_id}, 单词: {word}, 原因: {exc}")
+            return str(exc)
+    await asyncio.to_thread(_write_atomic, audio_path, data)
+    print(f"生成成功 - ID: {word_id}, 单词: {word}")
+    return None
+
+# 同一个单词的音频只下载一次，其余 ID 用硬链接（跨文件系统时复制）
+def _link_copies(src_name, copies):
+    src = os.path.join('audios', src_name)
+    linked = {src}
+    for word_id, word, filename in copies:
+        dst = os.path.join('audios', filename)
+        if dst in linked:
+            # 同一单词且同一 ID：文件已经下载（或链接）好了
+            continue
+        linked.add(dst)
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copyfile(src, dst)
+        print(f"复用音频 - ID: {word_id}, 单词: {word}")
+
+async def _generate(csv_file, start_id, concurrency, rate):
+    # 一次性扫描已存在的音频，避免每行一次 stat；顺便清理上次中断留下的 .part
+    existing = set()
+    for entry in os.scandir('audios'):
+        if entry.name.endswith('.part'):
+            os.unlink(entry.path)
+        else:
+            existing.add(entry.name)
+    groups = defaultdict(list)
     with open(csv_file, 'r', encoding='utf-8') as f:
         reader = csv.DictReader(f)
         for row in reader:
             word = row['word_diac']
             word_id = row['id']
-            audio_path = os.path.join('audios', f"audio_{word_id}.mp3")
+            filename = f"audio_{word_id}.mp3"
             
             # 如果指定了起始ID，跳过之前的
             if start_id and int(word_id) < start_id:
                 continue
             
+            groups[word].append((word_id, filename))
+    
+    jobs = []
+    copies = []
+    for word, rows in groups.items():
+        done = None
+        missing = []
+        for word_id, filename in rows:
             # 检查文件是否已存在
-            if os.path.exists(audio_path):
+            if filename in existing:
                 print(f"跳过已存在的音频 - ID: {word_id}, 单词: {word}")
-                continue
-            
-            # 使用Google TTS API
-            url = f"http://translate.google.com/translate_tts?ie=UTF-8&q={word}&tl=ar&client=tw-ob"
-            
-            response = requests.get(url)
-            if response.status_code == 200:
-                with open(audio_path, 'wb') as audio:
-                    audio.write(response.content)
-                print(f"生成成功 - ID: {word_id}, 单词: {word}")
+                done = done or filename
             else:
-                print(f"生成失败 - ID: {word_id}, 单词: {word}")
-            
-            time.sleep(1)  # 避免请求过快
+                missing.append((word_id, word, filename))
+        if not missing:
+            continue
+        if done:
+            copies.append((done, missing))
+            continue
+        word_id, _, filename = missing[0]
+        jobs.append((word_id, word, os.path.join('audios', filename)))
+        copies.append((filename, missing[1:]))
+    
+    # 并发下载，令牌桶限速（每秒 rate 个请求），避免请求过快；
+    # 跳过的行不消耗令牌，桶里攒下的令牌让后面的请求可以立即发出
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = AsyncLimiter(rate, 1)
+    connector = aiohttp.TCPConnector(
+        limit=concurrency,
+        limit_per_host=concurrency,
+        ttl_dns_cache=300,
+        keepalive_timeout=60,
+    )
+    timeout = aiohttp.ClientTimeout(total=10)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        if jobs:
+            await _prewarm(session)
+        reasons = await asyncio.gather(*(
+            _fetch(session, semaphore, limiter, word_id, word, audio_path)
+            for word_id, word, audio_path in jobs
+        ))
+    
+    # 最终失败的单词记录到 audios/failed.csv，之后重新运行即可补齐
+    failed = [(word_id, word, reason) for (word_id, word, _), reason in zip(jobs, reasons) if reason]
+    failed_words = {word: reason for _, word, reason in failed}
+    for src_name, dups in copies:
+        if not dups:
+            continue
+        word = dups[0][1]
+        if word in failed_words:
+            failed.extend((word_id, word, failed_words[word]) for word_id, word, _ in dups)
+        else:
+            _link_copies(src_name, dups)
+    if failed:
+        failed_path = os.path.join('audios', 'failed.csv')
+        is_new = not os.path.exists(failed_path)
+        with open(failed_path, 'a', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            if is_new:
+                writer.writerow(['id', 'word', 'reason'])
+            writer.writerows(failed)
+        print(f"失败 {len(failed)} 个，已记录到 {failed_path}")
+
+# 从CSV读取单词并生成音频
+def generate_audio_files(csv_file, start_id=None, concurrency=4, rate=5):
+    # 创建audios文件夹（如果不存在）
+    if not os.path.exists('audios'):
+        os.makedirs('audios')
+    
+    asyncio.run(_generate(csv_file, start_id, concurrency, rate))
 
 # 生成更新后的CSV（包含音频引用）
 def create_anki_csv(csv_file, output_file):
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
+    with open(csv_file, 'r', encoding='utf-8-sig') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        # 列下标只在表头查一次，逐行用列表下标取值
+        i_word, i_diac, i_ipa, i_en, i_cn, i_id = (
+            header.index(name) for name in ('word', 'word_diac', 'ipa', 'meaning_en', 'meaning_cn', 'id')
+        )
         with open(output_file, 'w', encoding='utf-8', newline='') as out:
             writer = csv.writer(out)
             writer.writerow(['word', 'word_diac', 'ipa', 'meaning_en', 'meaning_cn', 'audio'])
             
+            width = len(header)
             for row in reader:
-                writer.writerow([
-                    row['word'],
-                    row['word_diac'],
-                    row['ipa'],
-                    row['meaning_en'],
-                    row['meaning_cn'],
-                    f"[sound:audio_{row['id']}.mp3]"
-                ])
+                # 跳过空行，短行补齐到表头长度（与原先 DictReader 的行为一致）
+                if not row:
+                    continue
+                if len(row) < width:
+                    row = row + [''] * (width - len(row))
+                writer.writerow((
+                    row[i_word],
+                    row[i_diac],
+                    row[i_ipa],
+                    row[i_en],
+                    row[i_cn],
+                    f"[sound:audio_{row[i_id]}.mp3]"
+                ))
 
 # 使用 - 修改为你的文件名
 csv_file = 'arabicWords-003.csv'
@@ -27,6 +27,8 @@ Key parameters:
   --sample_rate         Output sample rate (default: 22050)
   --ext                 Output extension (default: wav)
   --cpu                 Force CPU (default uses CUDA if available)
+  --precision           fp32 | fp16 | bf16 inference on CUDA (default: fp32)
+  --cudnn_benchmark     Let cuDNN autotune conv kernels (pays off with --batch_size > 1)
 
 Output naming:
   - base name comes from --id_col if that cell is non-empty; otherwise uses row_<index>.
@@ -38,16 +40,27 @@ Models:
 """
 import argparse
 import csv
+import functools
 import os
 import re
+import shutil
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import NamedTuple
 
 import torch
 import torchaudio
 
 BASE_DIR = Path(__file__).resolve().parent
 REPO_ROOT = BASE_DIR / "tts-arabic-pytorch"
+# Rows buffered per sort window, in multiples of --batch_size.
+SORT_WINDOW = 16
+PRECISIONS = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
 
 
 def ensure_repo_on_path() -> None:
@@ -91,9 +104,40 @@ def choose_filename(row, id_col: int | None, index: int, ext: str) -> str:
     return f"row_{index}.{ext}"
 
 
+def autocast_tts(tts, device_type: str, dtype: torch.dtype):
+    # The models build some float tensors internally; autocast keeps them in step
+    # with the cast weights.
+    @functools.wraps(tts)
+    def wrapped(*args, **kwargs):
+        with torch.autocast(device_type=device_type, dtype=dtype):
+            return tts(*args, **kwargs)
+    return wrapped
+
+
+class Job(NamedTuple):
+    index: int
+    row_id: str
+    text: str
+    filename: str
+
+
+def prepare_jobs(csv_path: Path, text_col: int, fallback_col: int | None,
+                 id_col: int | None, ext: str) -> list[Job]:
+    # Parsed once and shared by every model in the run.
+    jobs: list[Job] = []
+    for index, row, text in iter_words(csv_path, text_col, fallback_col):
+        if not text:
+            continue
+        row_id = ""
+        if id_col is not None and id_col < len(row):
+            row_id = row[id_col].strip()
+        jobs.append(Job(index, row_id, text, choose_filename(row, id_col, index, ext)))
+    return jobs
+
+
 def load_model(model_name: str, checkpoint: str, vocoder_sd: str | None,
                vocoder_config: str | None, device: torch.device,
-               vowelizer: str | None):
+               vowelizer: str | None, precision: str = "fp32"):
     if model_name == "fastpitch":
         from models.fastpitch import FastPitch2Wave
         model = FastPitch2Wave(
@@ -115,6 +159,10 @@ def load_model(model_name: str, checkpoint: str, vocoder_sd: str | None,
 
     model = model.to(device)
     model.eval()
+    if precision != "fp32":
+        dtype = PRECISIONS[precision]
+        model = model.to(dtype)
+        model.tts = autocast_tts(model.tts, device.type, dtype)
     return model
 
 
@@ -132,15 +180,12 @@ def find_invalid_tokens(model, text: str, vowelizer: str | None) -> list[str]:
     return missing
 
 
-def synthesize_csv(
+def synthesize_jobs(
     *,
     model_name: str,
     model,
-    csv_path: Path,
+    jobs: list[Job],
     out_dir: Path,
-    text_col: int,
-    fallback_col: int | None,
-    id_col: int | None,
     batch_size: int,
     speed: float | None,
     denoise: float,
@@ -148,7 +193,6 @@ def synthesize_csv(
     sample_rate: int,
     limit: int,
     skip_existing: bool,
-    ext: str,
 ) -> int:
     out_dir.mkdir(parents=True, exist_ok=True)
 
@@ -156,6 +200,12 @@ def synthesize_csv(
     batch_texts: list[str] = []
     batch_paths: list[Path] = []
     batch_meta: list[tuple[int, str]] = []
+    pending: list[tuple[str, Path, tuple[int, str]]] = []
+    # First output path per text; later rows with the same text are linked to it.
+    first_output: dict[str, Path] = {}
+    duplicates: list[tuple[Path, Path, tuple[int, str], str]] = []
+    # Outputs dropped by the --limit cut; their duplicates are not skips.
+    cut_by_limit: set[Path] = set()
 
     skip_log_path = out_dir / "skipped.csv"
     skip_file = None
@@ -171,6 +221,43 @@ def synthesize_csv(
                 skip_writer.writerow(["row_index", "row_id", "text", "reason"])
         skip_writer.writerow([row_index, row_id, text, reason])
 
+    # Saving runs on a small pool so the next model.tts call is not held up by disk I/O.
+    io_pool = ThreadPoolExecutor(max_workers=4)
+    pending_saves: list[tuple[Future, tuple[int, str], str]] = []
+
+    def save(out_path: Path, wav, meta: tuple[int, str], text: str) -> None:
+        nonlocal processed
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        # Copy to CPU before handing off so the GPU buffer is released right away;
+        # torchaudio.save wants fp32 even when inference ran in half precision.
+        future = io_pool.submit(
+            torchaudio.save, str(out_path), wav.unsqueeze(0).cpu().float(), sample_rate
+        )
+        pending_saves.append((future, meta, text))
+        processed += 1
+
+    def reap_saves(wait: bool) -> None:
+        nonlocal processed
+        still_pending = []
+        for future, meta, text in pending_saves:
+            if not wait and not future.done():
+                still_pending.append((future, meta, text))
+                continue
+            exc = future.exception()
+            if exc is not None:
+                row_index, row_id = meta
+                log_skip(row_index, row_id, text, f"save_error:{exc}")
+                processed -= 1
+        pending_saves[:] = still_pending
+
+    # Without a phoneme table there is nothing to check, so skip tokenizing.
+    validate = bool(getattr(model.model, "phon_to_id", None))
+
+    # Vocabulary CSVs repeat words; tokenize (and vowelize) each distinct text once.
+    @functools.lru_cache(maxsize=100_000)
+    def invalid_tokens(text: str) -> tuple[str, ...]:
+        return tuple(find_invalid_tokens(model, text, vowelizer))
+
     def flush_batch() -> None:
         nonlocal processed
         if not batch_texts:
@@ -179,76 +266,126 @@ def synthesize_csv(
         paths = batch_paths
         metas = batch_meta
         if limit:
-            remaining = limit - processed
+            # Queued duplicates are linked later but count toward --limit too.
+            remaining = limit - processed - len(duplicates)
+            cut_by_limit.update(paths[max(remaining, 0):])
             if remaining <= 0:
+                batch_texts.clear()
+                batch_paths.clear()
+                batch_meta.clear()
                 return
             texts = texts[:remaining]
             paths = paths[:remaining]
             metas = metas[:remaining]
 
         try:
-            wavs = model.tts(
-                texts,
-                batch_size=batch_size,
-                speed=speed,
-                denoise=denoise,
-                vowelizer=vowelizer,
-            )
-            for (out_path, wav, meta) in zip(paths, wavs, metas):
-                out_path.parent.mkdir(parents=True, exist_ok=True)
-                torchaudio.save(str(out_path), wav.unsqueeze(0), sample_rate)
-                processed += 1
+            with torch.inference_mode():
+                wavs = model.tts(
+                    texts,
+                    batch_size=batch_size,
+                    speed=speed,
+                    denoise=denoise,
+                    vowelizer=vowelizer,
+                )
+            for (text, out_path, wav, meta) in zip(texts, paths, wavs, metas):
+                save(out_path, wav, meta, text)
         except Exception as exc:
             for (text, out_path, meta) in zip(texts, paths, metas):
                 row_index, row_id = meta
                 try:
-                    wav = model.tts(
-                        text,
-                        batch_size=1,
-                        speed=speed,
-                        denoise=denoise,
-                        vowelizer=vowelizer,
-                    )
-                    out_path.parent.mkdir(parents=True, exist_ok=True)
-                    torchaudio.save(str(out_path), wav.unsqueeze(0), sample_rate)
-                    processed += 1
+                    with torch.inference_mode():
+                        wav = model.tts(
+                            text,
+                            batch_size=1,
+                            speed=speed,
+                            denoise=denoise,
+                            vowelizer=vowelizer,
+                        )
+                    save(out_path, wav, meta, text)
                 except Exception as exc_item:
                     log_skip(row_index, row_id, text, f"tts_error:{exc_item}")
             log_skip(-1, "", "", f"batch_error:{exc}")
 
+        reap_saves(wait=False)
         batch_texts.clear()
         batch_paths.clear()
         batch_meta.clear()
 
-    try:
-        for index, row, text in iter_words(csv_path, text_col, fallback_col):
-            if not text:
+    def flush_pending() -> None:
+        # Batches are padded to their longest item, so group similar lengths.
+        # Output names come from the row, so write order does not matter.
+        pending.sort(key=lambda item: len(item[0]))
+        for start in range(0, len(pending), batch_size):
+            for text, out_path, meta in pending[start:start + batch_size]:
+                batch_texts.append(text)
+                batch_paths.append(out_path)
+                batch_meta.append(meta)
+            flush_batch()
+            if limit and processed >= limit:
+                break
+        pending.clear()
+
+    def link_duplicates() -> None:
+        nonlocal processed
+        for src, dst, meta, text in duplicates:
+            if limit and processed >= limit:
+                break
+            row_index, row_id = meta
+            if src in cut_by_limit:
                 continue
-            filename = choose_filename(row, id_col, index, ext)
+            if dst == src:
+                # Same text and same id: the row's file is already written.
+                # Still counted, as the baseline rewrote it.
+                processed += 1
+                continue
+            if not src.exists():
+                log_skip(row_index, row_id, text, f"duplicate_of:{src.name}")
+                continue
+            if dst.exists():
+                dst.unlink()
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copyfile(src, dst)
+            processed += 1
+
+    try:
+        for index, row_id, text, filename in jobs:
             out_path = out_dir / filename
             if skip_existing and out_path.exists():
+                first_output.setdefault(text, out_path)
                 continue
 
-            row_id = ""
-            if id_col is not None and id_col < len(row):
-                row_id = row[id_col].strip()
+            if text in first_output:
+                duplicates.append((first_output[text], out_path, (index, row_id), text))
+                if limit and processed + len(pending) + len(duplicates) >= limit:
+                    break
+                continue
 
-            missing = find_invalid_tokens(model, text, vowelizer)
+            missing = invalid_tokens(text) if validate else ()
             if missing:
                 log_skip(index, row_id, text, f"invalid_tokens:{' '.join(missing)}")
                 continue
 
-            batch_texts.append(text)
-            batch_paths.append(out_path)
-            batch_meta.append((index, row_id))
+            first_output[text] = out_path
+            pending.append((text, out_path, (index, row_id)))
 
-            if len(batch_texts) >= batch_size:
-                flush_batch()
-                if limit and processed >= limit:
+            window = batch_size * SORT_WINDOW
+            if limit:
+                # Do not read past the rows --limit will actually process.
+                window = min(window, limit - processed - len(duplicates))
+            if len(pending) >= window:
+                flush_pending()
+                if limit and processed + len(duplicates) >= limit:
                     break
 
-        flush_batch()
+        flush_pending()
+        io_pool.shutdown(wait=True)
+        reap_saves(wait=True)
+        link_duplicates()
     finally:
+        io_pool.shutdown(wait=True)
+        reap_saves(wait=True)
         if skip_file is not None:
             skip_file.close()
     return processed
@@ -312,6 +449,17 @@ def main() -> int:
     parser.add_argument("--sample_rate", type=int, default=22050, help="Sample rate")
     parser.add_argument("--ext", default="wav", help="Output extension")
     parser.add_argument("--cpu", action="store_true", help="Force CPU")
+    parser.add_argument(
+        "--precision",
+        default="fp32",
+        choices=list(PRECISIONS),
+        help="Inference precision on CUDA",
+    )
+    parser.add_argument(
+        "--cudnn_benchmark",
+        action="store_true",
+        help="Autotune cuDNN kernels (re-tunes for every new input length)",
+    )
 
     args = parser.parse_args()
 
@@ -326,32 +474,45 @@ def main() -> int:
     if not csv_path.exists():
         raise FileNotFoundError(f"CSV not found: {csv_path}")
 
+    jobs = prepare_jobs(csv_path, args.text_col, args.fallback_col, args.id_col, args.ext)
+
     ensure_repo_on_path()
 
     use_cuda = torch.cuda.is_available() and not args.cpu
     device = torch.device("cuda" if use_cuda else "cpu")
+    if use_cuda:
+        # TF32 matmuls on Ampere+; no effect on older GPUs.
+        torch.set_float32_matmul_precision("high")
+        torch.backends.cudnn.allow_tf32 = True
+        torch.backends.cudnn.benchmark = args.cudnn_benchmark
     vowelizer = None if args.vowelizer == "none" else args.vowelizer
-
-    total = 0
-
-    if args.model in ("fastpitch", "both"):
+    precision = args.precision
+    if precision != "fp32" and not use_cuda:
+        print(f"--precision {precision} needs CUDA; using fp32.", file=sys.stderr)
+        precision = "fp32"
+
+    checkpoints = {
+        "fastpitch": args.fastpitch_checkpoint,
+        "tacotron2": args.tacotron_checkpoint,
+    }
+    labels = {"fastpitch": "FastPitch", "tacotron2": "Tacotron2"}
+    model_names = ["fastpitch", "tacotron2"] if args.model == "both" else [args.model]
+
+    def run_model(model_name: str, model_device: torch.device) -> int:
         model = load_model(
-            "fastpitch",
-            args.fastpitch_checkpoint,
+            model_name,
+            checkpoints[model_name],
             args.vocoder_sd,
             args.vocoder_config,
-            device,
+            model_device,
             vowelizer,
+            precision,
         )
-        fp_out = out_dir / "fastpitch"
-        total_fp = synthesize_csv(
-            model_name="fastpitch",
+        generated = synthesize_jobs(
+            model_name=model_name,
             model=model,
-            csv_path=csv_path,
-            out_dir=fp_out,
-            text_col=args.text_col,
-            fallback_col=args.fallback_col,
-            id_col=args.id_col,
+            jobs=jobs,
+            out_dir=out_dir / model_name,
             batch_size=args.batch_size,
             speed=args.speed,
             denoise=args.denoise,
@@ -359,40 +520,27 @@ def main() -> int:
             sample_rate=args.sample_rate,
             limit=args.limit,
             skip_existing=args.skip_existing,
-            ext=args.ext,
         )
-        total += total_fp
-        print(f"FastPitch generated: {total_fp}")
+        print(f"{labels[model_name]} generated: {generated}")
+        return generated
 
-    if args.model in ("tacotron2", "both"):
-        model = load_model(
-            "tacotron2",
-            args.tacotron_checkpoint,
-            args.vocoder_sd,
-            args.vocoder_config,
-            device,
-            vowelizer,
-        )
-        tc_out = out_dir / "tacotron2"
-        total_tc = synthesize_csv(
-            model_name="tacotron2",
-            model=model,
-            csv_path=csv_path,
-            out_dir=tc_out,
-            text_col=args.text_col,
-            fallback_col=args.fallback_col,
-            id_col=args.id_col,
-            batch_size=args.batch_size,
-            speed=args.speed,
-            denoise=args.denoise,
-            vowelizer=vowelizer,
-            sample_rate=args.sample_rate,
-            limit=args.limit,
-            skip_existing=args.skip_existing,
-            ext=args.ext,
-        )
-        total += total_tc
-        print(f"Tacotron2 generated: {total_tc}")
+    def run_model_on_gpu(model_name: str, model_device: torch.device) -> int:
+        # Make the model's own default-device allocations land on its GPU too.
+        with torch.cuda.device(model_device):
+            return run_model(model_name, model_device)
+
+    total = 0
+    if len(model_names) == 2 and use_cuda and torch.cuda.device_count() >= 2:
+        # One model per GPU; each writes to its own out_dir, so nothing is shared.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [
+                pool.submit(run_model_on_gpu, name, torch.device(f"cuda:{i}"))
+                for i, name in enumerate(model_names)
+            ]
+            total = sum(f.result() for f in futures)
+    else:
+        for name in model_names:
+            total += run_model(name, device)
 
     print(f"Done. Total generated: {total}")
     return 0
@@ -19,11 +19,21 @@ Key parameters:
   --end_row        End at CSV row index (0 = to end)
   --limit          Limit rows to process (0 = all)
   --skip_existing  Skip if output wav already exists
+  --cache_dir      Reuse wavs across runs, keyed on (model, text, language, voice, trim)
+  --batch_size     Rows per synthesis batch (default: 1)
+  --max_chars      Split longer texts at sentence ends and join the audio (default: 200, 0=off)
+  --max_batch_chars  Cap on total characters per batch (default: 400)
   --model_name     XTTS model name (default: tts_models/multilingual/multi-dataset/xtts_v2)
   --language       Language code (default: ar)
   --gpu            Use CUDA if available
+  --precision      fp32 | fp16 | bf16 inference on CUDA (default: fp32)
+  --int8           CPU only: int8 dynamic quantization of the GPT's linear layers
+  --compile        torch.compile the GPT latent pass and the vocoder (warm-up at start)
+  --cuda_graph     CUDA only: replay the vocoder from CUDA graphs captured per padded shape
   --trim_silence   Trim leading/trailing silence
   --top_db         Silence threshold for trimming (default: 30)
+                   Writing runs on a writer thread, and trimming (and cache stores)
+                   on a thread pool, while the GPU synthesizes the next batch.
   --voice_1        Required. wav/dir or speaker:<name>
   --voice_2        Optional. wav/dir or speaker:<name>
   --voice_3        Optional. wav/dir or speaker:<name>
@@ -36,6 +46,17 @@ Defaults for voice_names (when not provided):
   3 voices -> voice1,voice2,voice3
   4 voices -> voice1,voice2,voice3,voice4
 
+Scheduling:
+  Batches run as asyncio tasks. Model calls go through one GPU thread behind
+  an asyncio.Semaphore(1), so cache lookups, links and tokenization for the
+  next batch overlap the current one. uvloop is used when installed.
+
+Batching:
+  XTTS decodes GPT tokens one sequence at a time, so --batch_size groups rows
+  per voice and runs the HiFi-GAN vocoder once over the padded batch.
+  Texts are sorted by length and packed greedily under --max_batch_chars, so
+  each batch holds similar lengths; outputs keep their row-based names.
+
 Row range:
   --start_row/--end_row apply to CSV data rows (1-based, after header).
   Example: --start_row 101 --end_row 200
@@ -43,49 +64,182 @@ Row range:
 Voice input rules:
   - Each --voice_N can be a single wav, a directory of wavs, or speaker:<name>.
   - If a directory is provided, all *.wav files inside are used.
-  - --trim_silence removes leading/trailing silence (uses librosa); adjust with --top_db.
+  - Reference wavs are resampled to 22.05 kHz mono once and cached next to them as
+    <wav>.xtts.fp16.npy; the sidecar is rebuilt when the wav is newer.
+  - --trim_silence removes leading/trailing silence (framed RMS gate); adjust with --top_db.
 
 Output naming:
   - base name comes from --id_col if that cell is non-empty; otherwise uses row_<index>.
   - output path: {out_dir}/{voice_name}/{base}.wav
+  - rows with identical text are synthesized once per voice; the others are hard links
+    (or copies) of that wav.
 
 Models:
   This script loads one XTTS model per run (set by --model_name).
+  Speaker conditioning latents are computed once per voice at startup.
   To list available models in your environment, try:
     python -m TTS --list_models
     tts --list_models
 """
 import argparse
+import asyncio
 import csv
+import hashlib
+import io
+import itertools
+import os
+import queue
+import re
+import shutil
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 
+import numpy as np
+import soundfile as sf
+import torch
+import torchaudio
 from TTS.api import TTS
 
+try:
+    import uvloop
+except ImportError:  # optional: plain asyncio loop
+    uvloop = None
+
+
+# Sentence terminators kept with the text before them.
+SENTENCE_END = re.compile(r"([.؟?!])")
+CLAUSE_END = re.compile(r"(،)")
+# XTTS loads reference audio at this rate for conditioning.
+REF_SAMPLE_RATE = 22050
+TRIM_FRAME = 512
+TRIM_HOP = 128
+CSV_BUFFER = 1 << 20
+# Post-processing futures kept before finished ones are dropped from the list.
+MAX_PENDING_POST = 64
+# Wavs waiting for the writer thread before synthesis blocks.
+WRITE_QUEUE_SIZE = 32
+# Batches being prepared while another one holds the GPU.
+IN_FLIGHT_BATCHES = 2
+# Longest latent sequence (GPT frames) replayed from a CUDA graph; longer
+# inputs run the vocoder eagerly.
+GRAPH_MAX_FRAMES = 1024
+GRAPH_MIN_FRAMES = 32
+PRECISIONS = {
+    "fp32": torch.float32,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+
+def to_pcm16(wav: np.ndarray) -> np.ndarray:
+    # Same peak normalization as Coqui's save_wav (used by tts_to_file), so
+    # new files match the loudness of ones written before.
+    wav_norm = wav * (32767 / max(0.01, float(np.max(np.abs(wav)))))
+    return wav_norm.astype(np.int16)
+
+
+def trim_wav(path: str, top_db: int) -> None:
+    # Framed RMS threshold relative to the loudest frame, the same rule as
+    # librosa.effects.trim but with shorter, uncentred frames, so the cut
+    # points are tighter than librosa's rather than identical to them.
+    # int16 in and out keeps untrimmed samples bit-exact.
+    y, sr = sf.read(path, dtype="int16", always_2d=False)
+    mono = (y.mean(axis=1) if y.ndim > 1 else y).astype(np.float32) / 32768
+    if len(mono) < TRIM_FRAME:
+        return
+    frames = np.lib.stride_tricks.sliding_window_view(mono, TRIM_FRAME)[::TRIM_HOP]
+    rms = np.sqrt(np.mean(frames ** 2, axis=-1))
+    ref = rms.max()
+    if ref <= 0:
+        return
+    nonsilent = np.flatnonzero(rms > ref * 10 ** (-top_db / 20))
+    if not len(nonsilent):
+        # --top_db <= 0 puts even the loudest frame under the threshold.
+        return
+    start = nonsilent[0] * TRIM_HOP
+    if nonsilent[-1] == len(rms) - 1:
+        # The frames stop short of the last (len - TRIM_FRAME) % TRIM_HOP
+        # samples; loud up to the final frame means keep the tail.
+        end = len(mono)
+    else:
+        end = nonsilent[-1] * TRIM_HOP + TRIM_FRAME
+    if start == 0 and end == len(mono):
+        # Nothing to cut; leave the file as written.
+        return
+    sf.write(path, y[start:end], sr)
 
-def trim_wav(path: Path, top_db: int) -> None:
-    # Lazy import to keep base deps small when trimming is not used.
+
+def remove_if_present(path: str) -> None:
     try:
-        import librosa
-        import soundfile as sf
-    except Exception as exc:  # pragma: no cover - runtime env dependent
-        raise RuntimeError(
-            "Trim requested but librosa/soundfile not available. "
-            "Install with: python -m pip install librosa soundfile"
-        ) from exc
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
 
-    y, sr = librosa.load(str(path), sr=None, mono=True)
-    y_trim, _ = librosa.effects.trim(y, top_db=top_db)
-    sf.write(str(path), y_trim, sr)
+def link_or_copy(src: str, dst: str) -> None:
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    remove_if_present(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
 
 
-def iter_words(csv_path: Path, text_col: int, fallback_col: int | None):
-    with csv_path.open("r", encoding="utf-8-sig", newline="") as f:
+def store_cached(out_path: str, cache_path: str) -> None:
+    if os.path.exists(cache_path):
+        return
+    try:
+        os.link(out_path, cache_path)
+    except FileExistsError:
+        pass
+    except OSError:
+        # Other filesystem: copy, then rename so readers never see half a file.
+        part = cache_path + ".part"
+        shutil.copyfile(out_path, part)
+        os.replace(part, cache_path)
+
+
+def finish_wav(out_path: str, top_db: int | None, cache_path: str | None,
+               copies: list[str]) -> None:
+    if top_db is not None:
+        trim_wav(out_path, top_db)
+    # Cache and fan out the final (trimmed) file so copies need no
+    # post-processing of their own.
+    if cache_path is not None:
+        store_cached(out_path, cache_path)
+    for dst in copies:
+        link_or_copy(out_path, dst)
+
+
+def voice_key(voice) -> str:
+    if voice["speaker"]:
+        return f"speaker:{voice['speaker']}"
+    return ",".join(sorted(str(Path(w).resolve()) for w in voice["speaker_wav"]))
+
+
+def cache_key(text: str, language: str, voice: str, top_db: int | None,
+              model_name: str) -> str:
+    trim = "" if top_db is None else str(top_db)
+    return hashlib.blake2b(
+        f"{model_name}|{text}|{language}|{voice}|{trim}".encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def iter_words(csv_path: Path, text_col: int, fallback_col: int | None,
+               start: int = 1, end: int | None = None):
+    # start/end are 1-based data row indexes (end inclusive); rows before
+    # start are dropped by islice before any per-row Python work.
+    with csv_path.open("rb", buffering=CSV_BUFFER) as raw:
+        f = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")
         reader = csv.reader(f)
         header = next(reader, None)
         if header is None:
             return
-        for i, row in enumerate(reader, start=1):
+        rows = itertools.islice(reader, max(start - 1, 0), end)
+        for i, row in enumerate(rows, start=max(start, 1)):
             if not row:
                 continue
             text = row[text_col] if text_col < len(row) else ""
@@ -114,9 +268,281 @@ def parse_voice_arg(value: str):
         if not p.exists():
             raise FileNotFoundError(f"Voice path not found: {p}")
         wavs.extend(collect_wavs(p))
+    # A directory plus a file inside it would otherwise be encoded twice;
+    # sorting keeps the speaker embedding and cache keys order-independent.
+    wavs = sorted(dict.fromkeys(str(Path(w).resolve()) for w in wavs))
     return {"speaker": None, "speaker_wav": wavs}
 
 
+def load_reference(path: str) -> np.ndarray:
+    sidecar = f"{path}.xtts.fp16.npy"
+    try:
+        if os.path.getmtime(sidecar) >= os.path.getmtime(path):
+            return np.load(sidecar).astype(np.float32)
+    except OSError:
+        pass
+    y, sr = sf.read(path, dtype="float32", always_2d=True)
+    audio = torch.from_numpy(y.mean(axis=1))
+    if sr != REF_SAMPLE_RATE:
+        audio = torchaudio.functional.resample(audio, sr, REF_SAMPLE_RATE)
+    audio = audio.clamp(-1, 1).numpy()
+    part = f"{sidecar}.part"
+    try:
+        with open(part, "wb") as f:
+            np.save(f, audio.astype(np.float16))
+        os.replace(part, sidecar)
+    except OSError:
+        # Read-only voice directory: just don't cache.
+        pass
+    return audio
+
+
+def voice_latents(model, voice):
+    # The speaker encoder runs once per voice instead of once per row as
+    # tts_to_file would.
+    if voice["speaker"]:
+        speaker = model.speaker_manager.speakers[voice["speaker"]]
+        gpt_cond_latent = speaker["gpt_cond_latent"]
+        speaker_embedding = speaker["speaker_embedding"]
+    else:
+        # Same steps as Xtts.get_conditioning_latents, fed from the cached
+        # 22.05 kHz reference audio instead of decoding and resampling again.
+        config = model.config
+        audios = []
+        embeddings = []
+        with torch.no_grad():
+            for path in voice["speaker_wav"]:
+                audio = torch.from_numpy(load_reference(path)).unsqueeze(0)
+                audio = audio[:, : REF_SAMPLE_RATE * config.max_ref_len].to(model.device)
+                if config.sound_norm_refs:
+                    audio = (audio / torch.abs(audio).max()) * 0.75
+                embeddings.append(model.get_speaker_embedding(audio, REF_SAMPLE_RATE))
+                audios.append(audio)
+            gpt_cond_latent = model.get_gpt_cond_latents(
+                torch.cat(audios, dim=-1),
+                REF_SAMPLE_RATE,
+                length=config.gpt_cond_len,
+                chunk_length=config.gpt_cond_chunk_len,
+            )
+            speaker_embedding = torch.stack(embeddings).mean(dim=0)
+    return gpt_cond_latent.to(model.device), speaker_embedding.to(model.device)
+
+
+def cast_model(model, dtype: torch.dtype) -> None:
+    model.to(dtype)
+    # LayerNorm statistics lose too much in half precision; autocast runs
+    # layer_norm in fp32 anyway, so keep those weights there too.
+    for module in model.modules():
+        if isinstance(module, torch.nn.LayerNorm):
+            module.float()
+
+
+def quantize_gpt(model) -> None:
+    # HF GPT-2 blocks use Conv1D (a Linear with transposed weights), which
+    # quantize_dynamic skips; swap them for nn.Linear first. The vocoder is
+    # left in fp32.
+    with torch.no_grad():
+        for parent in list(model.gpt.modules()):
+            for child_name, child in parent.named_children():
+                if type(child).__name__ != "Conv1D":
+                    continue
+                in_features, out_features = child.weight.shape
+                linear = torch.nn.Linear(in_features, out_features)
+                linear.weight.copy_(child.weight.t())
+                linear.bias.copy_(child.bias)
+                setattr(parent, child_name, linear)
+    model.gpt = torch.ao.quantization.quantize_dynamic(
+        model.gpt, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def compile_model(model) -> None:
+    # Only module forwards are compiled: the GPT latent pass and HiFi-GAN.
+    # gpt.generate stays eager because HF generation loops in Python.
+    mode = "reduce-overhead" if model.device.type == "cuda" else None
+    model.gpt = torch.compile(model.gpt, mode=mode, fullgraph=False)
+    model.hifigan_decoder = torch.compile(model.hifigan_decoder, mode=mode, fullgraph=False)
+
+
+def tokenize(model, text: str, language: str):
+    text_tokens = torch.IntTensor(
+        model.tokenizer.encode(text.strip().lower(), lang=language.split("-")[0])
+    ).unsqueeze(0).to(model.device)
+    if text_tokens.shape[-1] >= model.args.gpt_max_text_tokens:
+        raise ValueError(f"Text too long for XTTS ({text_tokens.shape[-1]} tokens): {text!r}")
+    return text_tokens
+
+
+def _bucket(n: int, minimum: int = 1) -> int:
+    return max(minimum, 1 << (n - 1).bit_length())
+
+
+class CudaGraphVocoder(torch.nn.Module):
+    """HiFi-GAN decoder replayed from CUDA graphs.
+
+    Inputs are zero-padded up to power-of-two (rows, frames) buckets, the same
+    padding synthesize_batch already applies to batches, and each bucket is
+    captured on first use. Oversized inputs, or any capture failure, fall back
+    to the eager decoder.
+    """
+
+    def __init__(self, decoder, max_frames: int = GRAPH_MAX_FRAMES):
+        super().__init__()
+        self.decoder = decoder
+        self.max_frames = max_frames
+        self.graphs = {}
+        self.pool = torch.cuda.graph_pool_handle()
+        self.failed = False
+
+    def _capture(self, key, latents, g):
+        rows, frames = key
+        static_in = latents.new_zeros((rows, frames, latents.shape[-1]))
+        static_g = torch.zeros_like(g)
+        # Warm up on a side stream before capture, as torch.cuda.graphs documents.
+        stream = torch.cuda.Stream()
+        stream.wait_stream(torch.cuda.current_stream())
+        with torch.cuda.stream(stream):
+            for _ in range(2):
+                self.decoder(static_in, g=static_g)
+        torch.cuda.current_stream().wait_stream(stream)
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=self.pool):
+            static_out = self.decoder(static_in, g=static_g)
+        entry = (graph, static_in, static_g, static_out)
+        self.graphs[key] = entry
+        return entry
+
+    def forward(self, latents, g=None):
+        rows, frames, _ = latents.shape
+        key = (_bucket(rows), _bucket(frames, GRAPH_MIN_FRAMES))
+        if self.failed or g is None or key[1] > self.max_frames:
+            return self.decoder(latents, g=g)
+        entry = self.graphs.get(key)
+        if entry is None:
+            try:
+                entry = self._capture(key, latents, g)
+            except RuntimeError as exc:
+                print(f"CUDA graph capture failed, using eager vocoder: {exc}", file=sys.stderr)
+                self.failed = True
+                return self.decoder(latents, g=g)
+        graph, static_in, static_g, static_out = entry
+        if static_g.shape != g.shape or static_in.dtype != latents.dtype:
+            return self.decoder(latents, g=g)
+        static_in.zero_()
+        static_in[:rows, :frames].copy_(latents)
+        static_g.copy_(g)
+        graph.replay()
+        samples = static_out.shape[-1] // key[1] * frames
+        # Clone: the next replay overwrites static_out.
+        return static_out[:rows, ..., :samples].clone()
+
+
+def gpt_latents(model, text_tokens, gpt_cond_latent):
+    # Same steps as Xtts.inference up to the vocoder, for one sentence.
+    config = model.config
+    gpt_codes = model.gpt.generate(
+        cond_latents=gpt_cond_latent,
+        text_inputs=text_tokens,
+        input_tokens=None,
+        do_sample=True,
+        top_p=config.top_p,
+        top_k=config.top_k,
+        temperature=config.temperature,
+        num_return_sequences=model.gpt_batch_size,
+        num_beams=1,
+        length_penalty=config.length_penalty,
+        repetition_penalty=config.repetition_penalty,
+        output_attentions=False,
+    )
+    expected_output_len = torch.tensor(
+        [gpt_codes.shape[-1] * model.gpt.code_stride_len], device=model.device
+    )
+    text_len = torch.tensor([text_tokens.shape[-1]], device=model.device)
+    latents = model.gpt(
+        text_tokens,
+        text_len,
+        gpt_codes,
+        expected_output_len,
+        cond_latents=gpt_cond_latent,
+        return_attentions=False,
+        return_latent=True,
+    )
+    # Under --compile (reduce-overhead) the output lives in a CUDA graph
+    # buffer that the next model.gpt call overwrites; callers keep one per
+    # text until the vocoder pass.
+    return latents.clone()
+
+
+def synthesize_batch(model, tokens: list, latents,
+                     dtype: torch.dtype = torch.float32) -> list:
+    gpt_cond_latent, speaker_embedding = latents
+    autocast = torch.autocast(
+        device_type=model.device.type, dtype=dtype, enabled=dtype != torch.float32
+    )
+    with torch.no_grad(), autocast:
+        per_text = [gpt_latents(model, t, gpt_cond_latent) for t in tokens]
+        if len(per_text) == 1:
+            wav = model.hifigan_decoder(per_text[0], g=speaker_embedding)
+            return [wav.cpu().float().squeeze().numpy()]
+        # One vocoder pass over the zero-padded batch, then cut each wav back
+        # to the length its own latents produce.
+        lengths = [lat.shape[1] for lat in per_text]
+        padded = torch.nn.utils.rnn.pad_sequence(
+            [lat.squeeze(0) for lat in per_text], batch_first=True
+        )
+        wavs = model.hifigan_decoder(padded, g=speaker_embedding).squeeze(1).cpu().float()
+    samples_per_frame = wavs.shape[-1] / padded.shape[1]
+    return [
+        wavs[i, : round(length * samples_per_frame)].numpy()
+        for i, length in enumerate(lengths)
+    ]
+
+
+def pack_batches(groups, batch_size: int, max_chars: int):
+    # Shortest first, closing a batch at batch_size texts or before it would
+    # pass max_chars; a single over-long text still gets its own batch.
+    items = sorted(groups.items(), key=lambda item: len(item[0]))
+    batch = []
+    chars = 0
+    for item in items:
+        size = len(item[0])
+        if batch and (len(batch) >= batch_size or chars + size > max_chars):
+            yield batch
+            batch = []
+            chars = 0
+        batch.append(item)
+        chars += size
+    if batch:
+        yield batch
+
+
+def _split_on(pattern: re.Pattern, text: str) -> list[str]:
+    parts = pattern.split(text)
+    pieces = ["".join(pair) for pair in zip(parts[0::2], parts[1::2] + [""])]
+    return [p for p in pieces if p.strip()]
+
+
+def split_text(text: str, max_chars: int) -> list[str]:
+    if not max_chars or len(text) <= max_chars:
+        return [text]
+    # Sentences first, then clauses, then words for anything still too long;
+    # neighbours are merged back up to max_chars.
+    pieces = []
+    for sentence in _split_on(SENTENCE_END, text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _split_on(CLAUSE_END, sentence):
+            pieces.extend([clause] if len(clause) <= max_chars else clause.split())
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + len(piece) + 1 <= max_chars:
+            chunks[-1] = f"{chunks[-1]} {piece.strip()}"
+        else:
+            chunks.append(piece.strip())
+    return chunks
+
+
 def choose_filename(row, id_col: int | None, index: int) -> str:
     if id_col is not None and id_col < len(row):
         _id = row[id_col].strip()
@@ -152,9 +578,29 @@ def main() -> int:
         help="End at CSV row index (0 = to end)",
     )
     parser.add_argument("--limit", type=int, default=0, help="Limit rows (0=all)")
+    parser.add_argument(
+        "--batch_size", type=int, default=1, help="Rows per synthesis batch"
+    )
+    parser.add_argument(
+        "--max_chars",
+        type=int,
+        default=200,
+        help="Split texts longer than this at sentence ends (0=off)",
+    )
+    parser.add_argument(
+        "--max_batch_chars",
+        type=int,
+        default=400,
+        help="Max total text characters per batch",
+    )
     parser.add_argument(
         "--skip_existing", action="store_true", help="Skip if file exists"
     )
+    parser.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory of cached wavs shared across runs",
+    )
     parser.add_argument(
         "--model_name",
         default="tts_models/multilingual/multi-dataset/xtts_v2",
@@ -164,6 +610,27 @@ def main() -> int:
     parser.add_argument(
         "--gpu", action="store_true", help="Use GPU (CUDA) if available"
     )
+    parser.add_argument(
+        "--precision",
+        default="fp32",
+        choices=list(PRECISIONS),
+        help="Inference precision on CUDA",
+    )
+    parser.add_argument(
+        "--int8",
+        action="store_true",
+        help="Quantize GPT linear layers to int8 (CPU only)",
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="torch.compile the GPT and vocoder (slow first call)",
+    )
+    parser.add_argument(
+        "--cuda_graph",
+        action="store_true",
+        help="Replay the vocoder from CUDA graphs (CUDA only)",
+    )
     parser.add_argument(
         "--trim_silence", action="store_true", help="Trim leading/trailing silence"
     )
@@ -212,6 +679,16 @@ def main() -> int:
 
     args = parser.parse_args()
 
+    if args.batch_size < 1:
+        print("--batch_size must be >= 1.", file=sys.stderr)
+        return 2
+    if args.max_chars < 0:
+        print("--max_chars must be >= 0.", file=sys.stderr)
+        return 2
+    if args.max_batch_chars < 1:
+        print("--max_batch_chars must be >= 1.", file=sys.stderr)
+        return 2
+
     if args.end_row and args.end_row < args.start_row:
         print("--end_row must be >= --start_row (or 0 for no end).", file=sys.stderr)
         return 2
@@ -258,48 +735,231 @@ def main() -> int:
             print(f"- {name}: {count} wavs")
 
     out_dir = Path(args.out_dir)
-    for name, _ in voices:
-        (out_dir / name).mkdir(parents=True, exist_ok=True)
+    voice_dirs = {name: str(out_dir / name) for name, _ in voices}
+    for voice_dir in voice_dirs.values():
+        os.makedirs(voice_dir, exist_ok=True)
+    # One directory listing per voice instead of a stat per row and voice.
+    existing = {
+        name: set(os.listdir(voice_dir)) if args.skip_existing else set()
+        for name, voice_dir in voice_dirs.items()
+    }
+    cache_dir = args.cache_dir or None
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    voice_keys = {name: voice_key(voice) for name, voice in voices}
+    top_db = args.top_db if args.trim_silence else None
 
     tts = TTS(args.model_name, gpu=args.gpu)
-
-    processed = 0
+    model = tts.synthesizer.tts_model
+    sample_rate = model.config.audio.output_sample_rate
+    precision = args.precision
+    if precision != "fp32" and model.device.type != "cuda":
+        print(f"--precision {precision} needs CUDA; using fp32.", file=sys.stderr)
+        precision = "fp32"
+    dtype = PRECISIONS[precision]
+    # Conditioning runs before the cast: the speaker encoder stays exact and
+    # only the cached latents are converted.
+    latents = {name: voice_latents(model, voice) for name, voice in voices}
+    if dtype != torch.float32:
+        cast_model(model, dtype)
+        latents = {
+            name: tuple(t.to(dtype) for t in pair)
+            for name, pair in latents.items()
+        }
+    if args.int8:
+        if model.device.type == "cpu":
+            quantize_gpt(model)
+        else:
+            print("--int8 is CPU only; ignoring.", file=sys.stderr)
+    # Every model call runs on this one thread (CUDA graphs from --compile
+    # are recorded per thread).
+    gpu_pool = ThreadPoolExecutor(max_workers=1)
+    if args.cuda_graph:
+        if model.device.type != "cuda":
+            print("--cuda_graph needs CUDA; ignoring.", file=sys.stderr)
+        elif args.compile:
+            print("--compile already uses CUDA graphs; ignoring --cuda_graph.", file=sys.stderr)
+        else:
+            # Graphs are captured lazily, on the GPU thread, per padded shape.
+            model.hifigan_decoder = CudaGraphVocoder(model.hifigan_decoder)
+    if args.compile:
+        compile_model(model)
+        # Pay the compile cost before the row loop starts; two texts so the
+        # batched vocoder path is exercised as well.
+        gpu_pool.submit(
+            synthesize_batch,
+            model,
+            [tokenize(model, text, args.language) for text in ("a", "ab")],
+            next(iter(latents.values())),
+            dtype,
+        ).result()
+
+    # Pre-pass: rows sharing a text are synthesized once per voice and the
+    # other rows get links to that wav.
+    groups: dict[str, list[tuple[int, str]]] = {}
+    row_count = 0
     end_row = args.end_row if args.end_row > 0 else None
-    for index, row, text in iter_words(Path(args.csv), args.text_col, args.fallback_col):
-        if index < args.start_row:
-            continue
-        if end_row is not None and index > end_row:
-            break
+    rows = iter_words(
+        Path(args.csv), args.text_col, args.fallback_col, args.start_row, end_row
+    )
+    for index, row, text in rows:
         if not text:
             continue
-        base = choose_filename(row, args.id_col, index)
-        for name, voice in voices:
-            out_path = out_dir / name / f"{base}.wav"
-            if args.skip_existing and out_path.exists():
+        groups.setdefault(text, []).append((index, choose_filename(row, args.id_col, index)))
+        row_count += 1
+        if args.limit and row_count >= args.limit:
+            break
+    if len(groups) < row_count:
+        print(f"Unique texts: {len(groups)} of {row_count} rows")
+
+    processed = 0
+    cache_hits = 0
+    post_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    write_queue: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+
+    def writer() -> None:
+        # Owns post_jobs: a wav is post-processed only after it is on disk.
+        post_jobs = []
+
+        def reap(wait_all: bool) -> list:
+            if wait_all:
+                wait(post_jobs)
+            for future in post_jobs:
+                if future.done() and future.exception() is not None:
+                    print(f"Post-processing failed: {future.exception()}", file=sys.stderr)
+            return [future for future in post_jobs if not future.done()]
+
+        while True:
+            item = write_queue.get()
+            if item is None:
+                break
+            out_path, wav, cache_path, copies = item
+            try:
+                # May be a hard link into the cache; don't write through it.
+                remove_if_present(out_path)
+                sf.write(out_path, to_pcm16(wav), sample_rate)
+            except Exception as exc:
+                print(f"Write failed: {out_path}: {exc}", file=sys.stderr)
                 continue
-            if voice["speaker"]:
-                tts.tts_to_file(
-                    text=text,
-                    file_path=str(out_path),
-                    speaker=voice["speaker"],
-                    language=args.language,
+            if top_db is not None or cache_path is not None or copies:
+                # soundfile and NumPy release the GIL, so this overlaps
+                # with synthesis and further writes.
+                post_jobs.append(
+                    post_pool.submit(finish_wav, out_path, top_db, cache_path, copies)
                 )
-            else:
-                tts.tts_to_file(
-                    text=text,
-                    file_path=str(out_path),
-                    speaker_wav=voice["speaker_wav"],
-                    language=args.language,
+            if len(post_jobs) > MAX_PENDING_POST:
+                post_jobs = reap(False)
+        reap(True)
+
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+
+    def plan_voice(name: str, batch) -> tuple[list, int]:
+        # Filesystem work for one voice: skip, link from existing outputs or
+        # the cache, and return what still needs synthesis plus the hit count.
+        todo = []
+        hits = 0
+        voice_dir = voice_dirs[name]
+        have = existing[name]
+        for text, occurrences in batch:
+            # A repeated id (same text) maps to the same file; list it once.
+            fnames = list(dict.fromkeys(f"{base}.wav" for _, base in occurrences))
+            missing = [os.path.join(voice_dir, f) for f in fnames if f not in have]
+            if not missing:
+                continue
+            if len(missing) < len(fnames):
+                src = next(f for f in fnames if f in have)
+                for dst in missing:
+                    link_or_copy(os.path.join(voice_dir, src), dst)
+                continue
+            cache_path = None
+            if cache_dir is not None:
+                key = cache_key(
+                    text, args.language, voice_keys[name], top_db, args.model_name
                 )
-            if args.trim_silence:
-                trim_wav(out_path, args.top_db)
-        processed += 1
-        if args.log_every and processed % args.log_every == 0:
-            print(f"Processed {processed} rows. Last row index: {index}")
-        if args.limit and processed >= args.limit:
-            break
+                cache_path = os.path.join(cache_dir, f"{key}.wav")
+                if os.path.exists(cache_path):
+                    for dst in missing:
+                        link_or_copy(cache_path, dst)
+                    hits += 1
+                    continue
+            todo.append((missing[0], text, cache_path, missing[1:]))
+        return todo, hits
+
+    def tokenize_texts(texts: list[str]) -> dict:
+        return {
+            text: [
+                tokenize(model, chunk, args.language)
+                for chunk in split_text(text, args.max_chars)
+            ]
+            for text in texts
+        }
+
+    async def synth_batch(batch: list[tuple[str, list[tuple[int, str]]]],
+                          gpu_lock: asyncio.Semaphore) -> None:
+        nonlocal processed, cache_hits
+        loop = asyncio.get_running_loop()
+        # Split and tokenized once per text and shared by every voice.
+        tokens = {}
+        for name, _ in voices:
+            # Blocking work goes to executors so the loop keeps serving the
+            # other in-flight batch.
+            todo, hits = await loop.run_in_executor(None, plan_voice, name, batch)
+            cache_hits += hits
+            if not todo:
+                continue
+            new_texts = list(dict.fromkeys(t for _, t, _, _ in todo if t not in tokens))
+            if new_texts:
+                tokens.update(await loop.run_in_executor(None, tokenize_texts, new_texts))
+            async with gpu_lock:
+                wavs = await loop.run_in_executor(
+                    gpu_pool,
+                    synthesize_batch,
+                    model,
+                    [t for _, text, _, _ in todo for t in tokens[text]],
+                    latents[name],
+                    dtype,
+                )
+            pos = 0
+            for out_path, text, cache_path, copies in todo:
+                count = len(tokens[text])
+                wav = wavs[pos] if count == 1 else np.concatenate(wavs[pos : pos + count])
+                pos += count
+                await loop.run_in_executor(
+                    None, write_queue.put, (out_path, wav, cache_path, copies)
+                )
+        before = processed
+        processed += sum(len(occurrences) for _, occurrences in batch)
+        if args.log_every and processed // args.log_every > before // args.log_every:
+            last_index = max(index for _, occurrences in batch for index, _ in occurrences)
+            print(f"Processed {processed} rows. Last row index: {last_index}")
+
+    async def run_batches() -> None:
+        gpu_lock = asyncio.Semaphore(1)
+        pending = set()
+        for batch in pack_batches(groups, args.batch_size, args.max_batch_chars):
+            pending.add(asyncio.create_task(synth_batch(batch, gpu_lock)))
+            if len(pending) >= IN_FLIGHT_BATCHES:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    task.result()
+        await asyncio.gather(*pending)
+
+    if uvloop is not None:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    try:
+        asyncio.run(run_batches())
+    finally:
+        write_queue.put(None)
+        writer_thread.join()
+        post_pool.shutdown()
+        gpu_pool.shutdown()
 
     print(f"Done. Generated {processed} words x {len(voices)} voices.")
+    if cache_dir is not None:
+        print(f"Cache hits: {cache_hits}")
     return 0
 
 